@@ -4,13 +4,37 @@ from homeassistant.const import (
     Platform,
 )
 from homeassistant.core import HomeAssistant
+import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers.typing import ConfigType
 from .pyvideohub import SmartVideoHub
+from .services import async_setup_services
 from .const import *
 
+CONFIG_SCHEMA = cv.config_entry_only_config_schema(DOMAIN)
+
+PLATFORMS = [
+    Platform.MEDIA_PLAYER,
+    Platform.SELECT,
+    Platform.TEXT,
+    Platform.BUTTON,
+    Platform.SWITCH,
+    Platform.SENSOR
+]
+
+async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
+    await async_setup_services(hass)
+    return True
+
 async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry):
     hass.data.setdefault(DOMAIN, {})
 
-    smartvideohub = SmartVideoHub(config_entry.data[CONF_HOST], config_entry.data[CONF_PORT], hass.loop)
+    smartvideohub = SmartVideoHub(
+        config_entry.data[CONF_HOST],
+        config_entry.data[CONF_PORT],
+        hass.loop,
+        command_rate=config_entry.options.get(CONF_COMMAND_RATE, COMMAND_RATE),
+        command_burst=config_entry.options.get(CONF_COMMAND_BURST, COMMAND_BURST),
+    )
     smartvideohub.start()
     await smartvideohub.initialised.wait()
 
@@ -18,27 +42,27 @@ async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry):
         "client": smartvideohub,
     }
 
+    config_entry.async_on_unload(config_entry.add_update_listener(async_update_options))
+
+    drift_interval = config_entry.options.get(CONF_DRIFT_INTERVAL, DEFAULT_DRIFT_INTERVAL)
+    if drift_interval:
+        config_entry.async_create_background_task(
+            hass, smartvideohub.drift_check(drift_interval), "smartvideohub drift check"
+        )
+
     hass.async_create_task(
-        hass.config_entries.async_forward_entry_setups(config_entry, [
-            Platform.MEDIA_PLAYER,
-            Platform.SELECT,
-            Platform.TEXT,
-            Platform.BUTTON,
-            Platform.SWITCH
-        ])
+        hass.config_entries.async_forward_entry_setups(config_entry, PLATFORMS)
     )
 
     return True
 
+async def async_update_options(hass: HomeAssistant, entry: ConfigEntry):
+    """Reload the entry so entities pick up changed options."""
+    await hass.config_entries.async_reload(entry.entry_id)
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     unload_ok = await hass.config_entries.async_unload_platforms(
-        entry, [
-            Platform.MEDIA_PLAYER,
-            Platform.SELECT,
-            Platform.TEXT,
-            Platform.BUTTON,
-            Platform.SWITCH
-        ]
+        entry, PLATFORMS
     )
-    hass.data[DOMAIN][entry.entry_id]['client'].stop()
-    return unload_ok
\ No newline at end of file
+    hass.data[DOMAIN].pop(entry.entry_id)['client'].stop()
+    return unload_ok
@@ -6,37 +6,56 @@ import asyncio
 
 import voluptuous as vol
 from homeassistant import config_entries
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.data_entry_flow import FlowResult
 
-from .const import DOMAIN, CONF_HOST, CONF_PORT, DEFAULT_PORT
-from .pyvideohub import SmartVideoHub
+from .const import (
+    DOMAIN,
+    CONF_HOST,
+    CONF_PORT,
+    CONF_COMMAND_BURST,
+    CONF_COMMAND_RATE,
+    CONF_DRIFT_INTERVAL,
+    CONF_TELEMETRY_INTERVAL,
+    CONF_TELEMETRY_THRESHOLD,
+    COMMAND_BURST,
+    COMMAND_RATE,
+    DEFAULT_DRIFT_INTERVAL,
+    DEFAULT_PORTS,
+    DEFAULT_TELEMETRY_INTERVAL,
+    DEFAULT_TELEMETRY_THRESHOLD,
+)
+from .pyvideohub import probe_first
 
 STEP_USER_DATA_SCHEMA = vol.Schema({
     vol.Required(CONF_HOST): str,
-    vol.Optional(CONF_PORT, default=DEFAULT_PORT): int
+    vol.Optional(CONF_PORT): int
 })
 
 _LOGGER = logging.getLogger(__name__)
 
 async def validate_input(hass: HomeAssistant, data: dict) -> dict[str, str]:
-    """Validate the user input allows us to connect."""
-    client = SmartVideoHub(
-        data[CONF_HOST],
-        data[CONF_PORT],
-        loop=hass.loop
-    )
-    await client.connect()
+    """Validate the user input allows us to connect.
 
-    try:
-        await client.initialised.wait()
+    Without a port, every default port is probed concurrently and the first
+    device to identify itself is used, without waiting for the other ports.
+    """
+    ports = [data[CONF_PORT]] if CONF_PORT in data else DEFAULT_PORTS
+    result, errors = await probe_first([(data[CONF_HOST], port) for port in ports])
 
-        return {"title": client.name}
+    if result is not None:
+        return {
+            "title": result.name,
+            "port": result.port,
+            "unique_id": result.unique_id,
+        }
 
-    except Exception as e:
-        client.stop()
-        _LOGGER.error("Communication Error: %s: %s", e.__class__.__name__, str(e))
-        raise ValueError("communication_error") from e
+    for error in errors:
+        # asyncio.TimeoutError subclasses OSError, so test for it first
+        if isinstance(error, (asyncio.TimeoutError, ValueError)):
+            _LOGGER.error("Communication Error: %s: %s", error.__class__.__name__, str(error))
+            raise ValueError("communication_error") from error
+    raise ConnectionError("Could not connect to %s" % data[CONF_HOST]) from errors[0]
 
 
 @config_entries.HANDLERS.register(DOMAIN)
@@ -46,6 +65,11 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     VERSION = 1
     CONNECTION_CLASS = config_entries.CONN_CLASS_LOCAL_POLL
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        return OptionsFlowHandler(config_entry)
+
     async def async_step_user(self, user_input: dict | None = None) -> FlowResult:
         """Handle the initial step."""
         errors = {}
@@ -53,9 +77,6 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         if user_input is not None:
             try:
                 info = await validate_input(self.hass, user_input)
-
-                return self.async_create_entry(title=info["title"], data=user_input)
-
             except (ConnectionError, ConnectionRefusedError):
                 errors["base"] = "cannot_connect"
             except ValueError as e:
@@ -67,9 +88,53 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             except Exception as e:  # pylint: disable=broad-except
                 _LOGGER.error("Unexcepted error %s: %s", e.__class__.__name__, e)
                 errors["base"] = "unknown"
+            else:
+                data = {**user_input, CONF_PORT: info["port"]}
+                if info["unique_id"]:
+                    await self.async_set_unique_id(info["unique_id"])
+                    self._abort_if_unique_id_configured(updates=data)
+                return self.async_create_entry(title=info["title"], data=data)
 
         return self.async_show_form(
             step_id="user",
             data_schema=STEP_USER_DATA_SCHEMA,
             errors=errors
         )
+
+
+class OptionsFlowHandler(config_entries.OptionsFlow):
+    """Handle options for an existing device."""
+
+    def __init__(self, config_entry):
+        self._entry = config_entry
+
+    async def async_step_init(self, user_input: dict | None = None) -> FlowResult:
+        if user_input is not None:
+            return self.async_create_entry(title="", data=user_input)
+
+        options = self._entry.options
+        return self.async_show_form(
+            step_id="init",
+            data_schema=vol.Schema({
+                vol.Optional(
+                    CONF_TELEMETRY_INTERVAL,
+                    default=options.get(CONF_TELEMETRY_INTERVAL, DEFAULT_TELEMETRY_INTERVAL)
+                ): vol.All(vol.Coerce(float), vol.Range(min=0)),
+                vol.Optional(
+                    CONF_TELEMETRY_THRESHOLD,
+                    default=options.get(CONF_TELEMETRY_THRESHOLD, DEFAULT_TELEMETRY_THRESHOLD)
+                ): vol.All(vol.Coerce(float), vol.Range(min=0, max=100)),
+                vol.Optional(
+                    CONF_COMMAND_RATE,
+                    default=options.get(CONF_COMMAND_RATE, COMMAND_RATE)
+                ): vol.All(vol.Coerce(float), vol.Range(min=0.1)),
+                vol.Optional(
+                    CONF_COMMAND_BURST,
+                    default=options.get(CONF_COMMAND_BURST, COMMAND_BURST)
+                ): vol.All(vol.Coerce(int), vol.Range(min=1)),
+                vol.Optional(
+                    CONF_DRIFT_INTERVAL,
+                    default=options.get(CONF_DRIFT_INTERVAL, DEFAULT_DRIFT_INTERVAL)
+                ): vol.All(vol.Coerce(int), vol.Range(min=0)),
+            })
+        )
@@ -2,9 +2,29 @@
 
 from datetime import timedelta
 from homeassistant.const import CONF_HOST, CONF_PORT
-from .pyvideohub import MODEL_TERANEX, MODEL_VIDEOHUB, MODEL_STREAMING
+from .pyvideohub import MODEL_TERANEX, MODEL_VIDEOHUB, MODEL_STREAMING, COMMAND_RATE, COMMAND_BURST
 
 DOMAIN = "smartvideohub"
 CONF_HIDE_DEFAULT_INPUTS = "hide_default_inputs"
+CONF_TELEMETRY_INTERVAL = "telemetry_interval"
+CONF_TELEMETRY_THRESHOLD = "telemetry_threshold"
+CONF_COMMAND_RATE = "command_rate"
+CONF_COMMAND_BURST = "command_burst"
+CONF_DRIFT_INTERVAL = "drift_interval"
 
 DEFAULT_PORT = 9990
+# Videohub, Web Presenter and Teranex Mini control ports
+DEFAULT_PORTS = (DEFAULT_PORT, 9977, 9995)
+DEFAULT_TELEMETRY_INTERVAL = 5
+DEFAULT_TELEMETRY_THRESHOLD = 5
+DEFAULT_DRIFT_INTERVAL = 0
+DEFAULT_WAIT_TIMEOUT = 10
+MAX_WAIT_TIMEOUT = 300
+
+ATTR_CONFIG_ENTRY_ID = "config_entry_id"
+ATTR_OUTPUT = "output"
+ATTR_INPUT = "input"
+ATTR_STATUS = "status"
+ATTR_TIMEOUT = "timeout"
+ATTR_START = "start"
+ATTR_END = "end"
@@ -0,0 +1,36 @@
+"""Diagnostics support for the Smart Video Hub integration."""
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt as dt_util
+
+from .const import *
+from .services import history_entry_as_dict
+
+TO_REDACT = {CONF_HOST, "Stream Key"}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    client = hass.data[DOMAIN][entry.entry_id]["client"]
+
+    client_data = client.diagnostics()
+    client_data["state_history"] = [
+        {"time": dt_util.utc_from_timestamp(timestamp).isoformat(), "state": state}
+        for timestamp, state in client_data["state_history"]
+    ]
+
+    return {
+        "entry": {
+            "data": async_redact_data(entry.data, TO_REDACT),
+            "options": dict(entry.options),
+        },
+        "client": async_redact_data(client_data, TO_REDACT),
+        "history": [history_entry_as_dict(change) for change in client.history],
+    }
@@ -113,13 +113,13 @@ class SmartVideoHubOutput(MediaPlayerEntity):
         """Title of current playing media."""
         return self._attr_source
 
-    def select_source(self, source):
+    async def async_select_source(self, source):
         """Set input source."""
         return self._smartvideohub.set_input_by_name(self._output_id, source)
 
     def update_callback(self, output_id=0):
         """Called when data is received by pySmartVideoHub"""
-        if output_id == 0 | output_id == self._output_id:
+        if output_id == 0 or output_id == self._output_id:
             _LOGGER.info("SmartVideoHub sent a status update for output %i", output_id)
             self.update()
             self.schedule_update_ha_state(False)
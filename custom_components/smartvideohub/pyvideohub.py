@@ -1,9 +1,12 @@
 import asyncio
+import bisect
+import itertools
 import logging
-import re
+import time
 import collections
 
 from asyncio import ensure_future
+from datetime import timedelta
 
 _LOGGER = logging.getLogger(__name__)
 SERVER_RECONNECT_DELAY = 30
@@ -12,12 +15,251 @@ MODEL_VIDEOHUB = "VideoHub"
 MODEL_STREAMING = "Streaming"
 MODEL_TERANEX = "TERANEX"
 
+# Outbound command token bucket: sustained commands per second, burst size and
+# the number of commands which may wait for a token before new ones are dropped.
+COMMAND_RATE = 10
+COMMAND_BURST = 10
+COMMAND_QUEUE_SIZE = 64
+
+# Number of routing and label changes kept in the history ring buffer.
+HISTORY_SIZE = 20000
+
+# Blocks re-requested by resync() for each model.
+RESYNC_BLOCKS = {
+    MODEL_VIDEOHUB: ("INPUT LABELS", "OUTPUT LABELS", "VIDEO OUTPUT ROUTING"),
+    MODEL_STREAMING: ("STREAM SETTINGS", "STREAM STATE"),
+    MODEL_TERANEX: ("VIDEO OUTPUT",),
+}
+RESYNC_TIMEOUT = 10
+
+# Connection state machine, the last STATE_HISTORY_SIZE transitions are kept
+# for diagnostics.
+STATE_CONNECTING = "connecting"
+STATE_CONNECTED = "connected"
+STATE_INITIALISED = "initialised"
+STATE_DISCONNECTED = "disconnected"
+STATE_STOPPED = "stopped"
+STATE_HISTORY_SIZE = 50
+
+# Upper bounds in milliseconds of the command latency histogram buckets, the
+# last bucket counts everything slower.
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000)
+
+HISTORY_ROUTE = "route"
+HISTORY_INPUT_LABEL = "input_label"
+HISTORY_OUTPUT_LABEL = "output_label"
+
+SOURCE_DEVICE = "device"
+SOURCE_LOCAL = "local"
+
+# One routing or label change: epoch timestamp, kind, output (or input, for
+# input labels) number, the old and new input number or label, and whether it
+# was echoed by the device or requested locally.
+HistoryEntry = collections.namedtuple(
+    "HistoryEntry", ["timestamp", "kind", "index", "old", "new", "source"]
+)
+
+# Blocks which identify a device, the first one received ends a probe().
+IDENTITY_BLOCKS = ("VIDEOHUB DEVICE", "IDENTITY", "TERANEX MINI DEVICE")
+PROBE_TIMEOUT = 5
+
+ProbeResult = collections.namedtuple(
+    "ProbeResult",
+    ["host", "port", "model", "name", "unique_id", "protocol_version", "attrs"],
+)
+
+# STREAM STATE fields which change continuously while streaming. These are
+# delivered to telemetry callbacks only, so they never wake configuration
+# entities.
+STREAM_TELEMETRY_KEYS = ("Bitrate", "Duration", "Cache Used")
+
+# Capability fields from STREAM SETTINGS and TERANEX MINI DEVICE, mapped to the
+# option list they feed.
+OPTION_FIELDS = {
+    "Available Default Platforms": "platform",
+    "Available Custom Platforms": "platform",
+    "Available Video Modes": "video_mode",
+    "Available Quality Levels": "quality_level",
+    "Number of LUTs": "lut",
+}
+
+
+def _parse_int(value):
+    """Parse the leading integer of a value such as '4500000' or '12%'."""
+    try:
+        return int(value.split(" ", 1)[0].rstrip("%"))
+    except ValueError:
+        return None
+
+
+def _parse_duration(value):
+    """Parse a duration such as '01:02:03' or '1:01:02:03' into a timedelta."""
+    try:
+        parts = [int(part) for part in value.split(":")]
+    except ValueError:
+        return None
+    days = parts.pop(0) if len(parts) > 3 else 0
+    seconds = 0
+    for part in parts:
+        seconds = seconds * 60 + part
+    return timedelta(days=days, seconds=seconds)
+
+
+class TimingProfile:
+    """Count, total and worst duration of a repeated operation."""
+
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.total * 1000 / self.count if self.count else 0.0,
+            "max_ms": self.max * 1000,
+        }
+
+
+def _identify(blocks):
+    """Return the model, name and unique ID described by a device's identity block."""
+    if "VIDEOHUB DEVICE" in blocks:
+        identity = blocks["VIDEOHUB DEVICE"]
+        return MODEL_VIDEOHUB, identity.get("Friendly Name", ""), identity.get("Unique ID")
+    if "TERANEX MINI DEVICE" in blocks:
+        identity = blocks["TERANEX MINI DEVICE"]
+        return MODEL_TERANEX, identity.get("Label", ""), identity.get("Unique ID")
+    identity = blocks.get("IDENTITY", {})
+    model = MODEL_STREAMING if identity.get("Model", "").startswith("Blackmagic Web Presenter") else None
+    return model, identity.get("Label", ""), identity.get("Unique ID")
+
+
+async def _read_identity(reader):
+    """Read blocks from a fresh connection up to the end of the identity block."""
+    blocks = dict()
+    block = None
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ValueError("Connection closed before the device identity was received")
+        line = line.decode("utf-8").strip()
+        if not line:
+            if block in IDENTITY_BLOCKS:
+                return blocks
+            block = None
+        elif block is None and line.endswith(":"):
+            block = line[:-1]
+            blocks[block] = dict()
+        elif block is not None:
+            key, _, value = line.partition(": ")
+            blocks[block][key] = value.strip()
+
+
+async def probe(host, port, timeout=PROBE_TIMEOUT):
+    """Identify the device at host:port without loading its full state.
+
+    Only the PROTOCOL PREAMBLE and identity block are read before disconnecting.
+    Raises OSError if the connection fails, asyncio.TimeoutError if the device
+    does not identify itself within timeout and ValueError if it hangs up.
+    """
+    async def identify():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            blocks = await _read_identity(reader)
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+        model, name, unique_id = _identify(blocks)
+        identity = dict()
+        for block in IDENTITY_BLOCKS:
+            identity.update(blocks.get(block, {}))
+        return ProbeResult(
+            host,
+            port,
+            model,
+            name,
+            unique_id,
+            blocks.get("PROTOCOL PREAMBLE", {}).get("Version"),
+            identity,
+        )
+
+    return await asyncio.wait_for(identify(), timeout)
+
+
+async def probe_many(targets, timeout=PROBE_TIMEOUT):
+    """Probe (host, port) targets concurrently.
+
+    Returns a list in the order of targets holding a ProbeResult, or the
+    exception raised for that target.
+    """
+    return await asyncio.gather(
+        *(probe(host, port, timeout) for host, port in targets),
+        return_exceptions=True,
+    )
+
+
+async def probe_first(targets, timeout=PROBE_TIMEOUT):
+    """Probe (host, port) targets concurrently until one identifies itself.
+
+    Returns that ProbeResult, or None if every probe failed, together with the
+    exceptions raised by the probes that finished first. The remaining probes
+    are cancelled and their connections closed before returning.
+    """
+    tasks = [asyncio.ensure_future(probe(host, port, timeout)) for host, port in targets]
+    errors = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                return await next_done, errors
+            except Exception as e:  # pylint: disable=broad-except
+                errors.append(e)
+        return None, errors
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _split_options(value):
+    """Split a comma separated capability field into a tuple."""
+    return tuple(value.split(", ")) if value else ()
+
+
+def parse_telemetry(key, value):
+    """Convert a raw STREAM STATE telemetry value into its typed form."""
+    if key == "Duration":
+        return _parse_duration(value)
+    return _parse_int(value)
+
+
 class SmartVideoHub(asyncio.Protocol):
-    def __init__(self, host, port, loop=None):
+    def __init__(
+        self,
+        host,
+        port,
+        loop=None,
+        command_rate=COMMAND_RATE,
+        command_burst=COMMAND_BURST,
+        max_queue=COMMAND_QUEUE_SIZE,
+        history_size=HISTORY_SIZE,
+    ):
         self._cmdServer = host
         self._cmdServerPort = port
         self._transport = None
         self._updateCallbacks = []
+        self._telemetryCallbacks = []
         self._errorMessage = None
         self._connected = False
         self._connecting = False
@@ -28,9 +270,53 @@ class SmartVideoHub(asyncio.Protocol):
         self.attrs = dict()
         self.stream_set = dict()
         self.stream_state = dict()
+        self.stream_telemetry = dict()
         self.teranex_set = dict()
+        self.options = dict()
+        self._optionSources = dict()
         self.model = None
         self.name = ""
+        self.history = collections.deque(maxlen=history_size)
+        self._rxBuffer = bytearray()
+        self._currentBlock = None
+        self._blockChanged = False
+        # resync() futures: by queue key until the query is written, then on its
+        # _awaitingAck entry until ACKed, then by block name until the block ends.
+        self._queryWaiters = dict()
+        self._blockWaiters = dict()
+        # Outbound commands keyed by merge key, so a newer command for the same
+        # output or setting replaces one still waiting in the queue.
+        self._commandQueue = collections.OrderedDict()
+        self._commandIds = itertools.count()
+        self._commandRate = command_rate
+        self._commandBurst = command_burst
+        self._maxQueue = max_queue
+        self._tokens = float(command_burst)
+        self._tokensUpdated = 0.0
+        self._drainHandle = None
+        self._writingPaused = False
+        # Pending wait_for_route futures by output, and wait_for_stream_status futures.
+        self._routeWaiters = dict()
+        self._statusWaiters = []
+        self.commands_merged = 0
+        self.commands_dropped = 0
+        # Diagnostics: state transitions, commands awaiting an ACK or NAK as
+        # (send time, block, resync waiters), latency histograms by block and
+        # timing profiles. The ACK FIFO holds at most max_queue commands, see
+        # _drain_queue.
+        self.state_history = collections.deque(maxlen=STATE_HISTORY_SIZE)
+        self._awaitingAck = collections.deque()
+        self.ack_overflows = 0
+        self.command_latency = dict()
+        self.commands_nak = 0
+        # parse_timing excludes the callbacks made while parsing, which are
+        # profiled separately.
+        self.parse_timing = TimingProfile()
+        self.update_callback_timing = TimingProfile()
+        self.telemetry_callback_timing = TimingProfile()
+        self._callbackElapsed = 0.0
+        # Cached once per read so the parse path never formats unused debug lines
+        self._debug = False
 
         if loop:
             _LOGGER.debug("Latching onto an existing event loop")
@@ -42,98 +328,281 @@ class SmartVideoHub(asyncio.Protocol):
         self._transport = transport
         self._connected = True
         self._connecting = False
+        self._set_state(STATE_CONNECTED)
+        self._writingPaused = False
+        self._drain_queue()
+
+    def pause_writing(self):
+        """asyncio callback when the transport write buffer is above its high-water mark."""
+        _LOGGER.debug("Transport buffer full, pausing outbound commands")
+        self._writingPaused = True
+
+    def resume_writing(self):
+        """asyncio callback when the transport write buffer has drained."""
+        _LOGGER.debug("Transport buffer drained, resuming outbound commands")
+        self._writingPaused = False
+        self._drain_queue()
 
     def data_received(self, data):
-        """asyncio callback when data is received on the socket"""
-        if data != "":
-            lines = str.splitlines(data.decode("utf-8"), 1)
-            current_block = None
-            for line in lines:
-                # Check for blank lines, these indicate the end of a block
-                if not line.strip():
-                    current_block = None
-                elif not line:
-                    break
-                else:
-                    search = re.search("([A-Z ]+):[\r\n]", line)
-                    line_conf = line.split(": ")
-
-                    if search:
-                        current_block = search.group(1)
-                        _LOGGER.debug("Parsing block %s", current_block)
-                        if current_block == "END PRELUDE":
-                            self.initialised.set()
+        """asyncio callback when data is received on the socket
+
+        Lines are split out of a reusable receive buffer as bytes, so a partial
+        line is kept for the next read. Routing numbers are parsed straight from
+        the bytes, only labels and settings are decoded, and nothing is stored
+        or notified unless it changed.
+        """
+        started = time.perf_counter()
+        self._callbackElapsed = 0.0
+        self._debug = _LOGGER.isEnabledFor(logging.DEBUG)
+        buffer = self._rxBuffer
+        buffer += data
+        # Blocks such as a full routing table may span several reads
+        current_block = self._currentBlock
+        block_changed = self._blockChanged
+        start = 0
+        with memoryview(buffer) as view:
+            end = buffer.find(b"\n")
+            while end != -1:
+                line_end = end - 1 if end > start and buffer[end - 1] == 13 else end
+                try:
+                    # Check for blank lines, these indicate the end of a block
+                    if line_end == start:
+                        if block_changed and self.initialised.is_set():
                             self._send_update_callback(output_id=0)
-                    elif current_block == "INPUT LABELS":
-                        input_number = int(line.split(" ", 1)[0]) + 1
-                        input_label = line.split(" ", 1)[1].strip()
-                        self.inputs.setdefault(input_number, input_label)
-                        if input_label != "Input " + str(input_number):
-                            self.filtered_inputs.setdefault(input_number, input_label)
-                        _LOGGER.debug("Named input %i as %s", input_number, input_label)
-                    elif current_block == "OUTPUT LABELS":
-                        output_number = int(line.split(" ", 1)[0]) + 1
-                        output_label = line.split(" ", 1)[1].strip()
-                        self.outputs[output_number]["name"] = output_label
-                        self.outputs[output_number]["output"] = output_number
-                        _LOGGER.debug(
-                            "Named output %i as %s", output_number, output_label
-                        )
+                        if current_block in self._blockWaiters:
+                            self._complete_futures(self._blockWaiters.pop(current_block), True)
+                        current_block = None
+                        block_changed = False
+                    elif current_block is None:
+                        # A block starts with its name, outside a block the device only acknowledges commands
+                        if buffer[line_end - 1] == 58:
+                            current_block = str(view[start:line_end - 1], "ascii")
+                            self._parse_block_start(current_block)
+                        elif buffer.startswith(b"ACK", start, line_end):
+                            self._command_answered(True)
+                        elif buffer.startswith(b"NAK", start, line_end):
+                            self._command_answered(False)
                     elif current_block == "VIDEO OUTPUT ROUTING":
-                        output_id = int(line.split(" ", 1)[0]) + 1
-                        input_id = int(line.split(" ", 1)[1]) + 1
-                        self.outputs[output_id]["input"] = input_id
-                        self.outputs[output_id]["input_name"] = self.get_input_name(input_id)
-                        _LOGGER.debug(
-                            "Output %i is now displaying input %i", output_id, input_id
+                        space = buffer.find(b" ", start, line_end)
+                        self._parse_route(
+                            int(buffer[start:space]) + 1, int(buffer[space + 1:line_end]) + 1
                         )
-                        if self.initialised.is_set():
-                            self._send_update_callback(output_id=output_id)
-                    elif current_block == "VIDEOHUB DEVICE":
-                        self.model = MODEL_VIDEOHUB
-                        if len(line_conf) == 2 and line_conf[1].strip() != "":
-                            self.attrs[line_conf[0]] = line_conf[1].strip()
-                            if line_conf[0] == "Friendly Name":
-                                self.name = line_conf[1].strip()
-                    elif current_block == "IDENTITY":
-                        if len(line_conf) == 2 and line_conf[1].strip() != "":
-                            self.attrs[line_conf[0]] = line_conf[1].strip()
-                            if line_conf[0] == "Model":
-                                if line_conf[1].startswith("Blackmagic Web Presenter"):
-                                    self.model = MODEL_STREAMING
-                            elif line_conf[0] == "Label":
-                                self.name = line_conf[1].strip()
-                    elif current_block == "STREAM SETTINGS":
-                        if len(line_conf) == 2 and line_conf[1].strip() != "":
-                            self.stream_set[line_conf[0]] = line_conf[1].strip()
-                        if self.initialised.is_set():
-                            self._send_update_callback(output_id=0)
-                    elif current_block == "STREAM STATE":
-                        if len(line_conf) == 2 and line_conf[1].strip() != "":
-                            self.stream_state[line_conf[0]] = line_conf[1].strip()
-                        if self.initialised.is_set():
-                            self._send_update_callback(output_id=0)
-                    elif current_block == "TERANEX MINI DEVICE":
-                        self.model = MODEL_TERANEX
-                        if len(line_conf) == 2 and line_conf[1].strip() != "":
-                            if line_conf[0] == "Unique ID":
-                                self.attrs[line_conf[0]] = line_conf[1].strip()
-                            elif line_conf[0] == "Label":
-                                self.name = line_conf[1].strip()
-                            self.teranex_set[line_conf[0]] = line_conf[1].strip()
-                        if self.initialised.is_set():
-                            self._send_update_callback(output_id=0)
-                    elif current_block == "VIDEO OUTPUT":
-                        if len(line_conf) == 2 and line_conf[1].strip() != "":
-                            self.teranex_set[line_conf[0]] = line_conf[1].strip()
-                        if self.initialised.is_set():
-                            self._send_update_callback(output_id=0)
+                    elif current_block == "OUTPUT LABELS":
+                        space = buffer.find(b" ", start, line_end)
+                        self._parse_output_label(
+                            int(buffer[start:space]) + 1,
+                            str(view[space + 1:line_end], "utf-8", "replace").strip(),
+                        )
+                    elif current_block == "INPUT LABELS":
+                        space = buffer.find(b" ", start, line_end)
+                        if self._parse_input_label(
+                            int(buffer[start:space]) + 1,
+                            str(view[space + 1:line_end], "utf-8", "replace").strip(),
+                        ):
+                            block_changed = True
+                    else:
+                        key, _, value = str(view[start:line_end], "utf-8", "replace").partition(": ")
+                        value = value.strip()
+                        if value and self._parse_setting(current_block, key, value):
+                            block_changed = True
+                except ValueError:
+                    _LOGGER.warning(
+                        "Ignoring malformed %s line: %r", current_block, bytes(view[start:line_end])
+                    )
+                start = end + 1
+                end = buffer.find(b"\n", start)
+        del buffer[:start]
+        self._currentBlock = current_block
+        self._blockChanged = block_changed
+        self.parse_timing.add(time.perf_counter() - started - self._callbackElapsed)
+
+    def _reset_awaiting_ack(self):
+        """Forget the commands awaiting an ACK, failing their resync waiters."""
+        for _, _, waiters in self._awaitingAck:
+            if waiters:
+                self._complete_futures(waiters, False)
+        self._awaitingAck.clear()
+
+    def _set_state(self, state):
+        self.state_history.append((time.time(), state))
+
+    def _command_answered(self, acknowledged):
+        """Record the latency of the oldest command waiting for an ACK or NAK."""
+        if not acknowledged:
+            self.commands_nak += 1
+        if not self._awaitingAck:
+            return
+        sent, block, waiters = self._awaitingAck.popleft()
+        if waiters:
+            # The device answers a query with an ACK followed by the requested block
+            if acknowledged:
+                self._blockWaiters.setdefault(block, []).extend(waiters)
+            else:
+                self._complete_futures(waiters, False)
+        elapsed = (time.monotonic() - sent) * 1000
+        histogram = self.command_latency.get(block)
+        if histogram is None:
+            histogram = self.command_latency[block] = [0] * (len(LATENCY_BUCKETS) + 1)
+        histogram[bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+
+    def _parse_block_start(self, block):
+        if self._debug:
+            _LOGGER.debug("Parsing block %s", block)
+        if block == "END PRELUDE":
+            self.initialised.set()
+            self._set_state(STATE_INITIALISED)
+            self._send_update_callback(output_id=0)
+        elif block == "VIDEOHUB DEVICE":
+            self.model = MODEL_VIDEOHUB
+        elif block == "TERANEX MINI DEVICE":
+            self.model = MODEL_TERANEX
+
+    def _parse_input_label(self, input_number, input_label):
+        """Apply an INPUT LABELS line, returning True if the label changed."""
+        old_label = self.inputs.get(input_number)
+        if old_label == input_label:
+            return False
+        self.inputs[input_number] = input_label
+        if input_label != "Input " + str(input_number):
+            self.filtered_inputs[input_number] = input_label
+        else:
+            self.filtered_inputs.pop(input_number, None)
+        self.history.append(HistoryEntry(
+            time.time(), HISTORY_INPUT_LABEL, input_number,
+            old_label, input_label, SOURCE_DEVICE
+        ))
+        if self._debug:
+            _LOGGER.debug("Named input %i as %s", input_number, input_label)
+        return True
+
+    def _parse_output_label(self, output_number, output_label):
+        """Apply an OUTPUT LABELS line, notifying the output if its label changed."""
+        output = self.outputs[output_number]
+        old_label = output.get("name")
+        if old_label == output_label:
+            return
+        self.history.append(HistoryEntry(
+            time.time(), HISTORY_OUTPUT_LABEL, output_number,
+            old_label, output_label, SOURCE_DEVICE
+        ))
+        output["name"] = output_label
+        output["output"] = output_number
+        if self._debug:
+            _LOGGER.debug("Named output %i as %s", output_number, output_label)
+        if self.initialised.is_set():
+            self._send_update_callback(output_id=output_number)
+
+    def _parse_route(self, output_id, input_id):
+        """Apply a VIDEO OUTPUT ROUTING line, notifying the output if its input changed."""
+        output = self.outputs[output_id]
+        old_input = output.get("input")
+        if old_input == input_id:
+            return
+        self.history.append(HistoryEntry(
+            time.time(), HISTORY_ROUTE, output_id,
+            old_input, input_id, SOURCE_DEVICE
+        ))
+        output["input"] = input_id
+        output["input_name"] = self.get_input_name(input_id)
+        if self._debug:
+            _LOGGER.debug("Output %i is now displaying input %i", output_id, input_id)
+        if output_id in self._routeWaiters:
+            self._resolve_waiters(self._routeWaiters[output_id], input_id)
+        if self.initialised.is_set():
+            self._send_update_callback(output_id=output_id)
+
+    def _parse_setting(self, block, key, value):
+        """Apply a 'Key: Value' line of a device or settings block.
+
+        Returns True if a value shown by the configuration entities changed, these
+        are notified once at the end of the block.
+        """
+        if block == "VIDEOHUB DEVICE":
+            self.attrs[key] = value
+            if key == "Friendly Name":
+                self.name = value
+        elif block == "IDENTITY":
+            self.attrs[key] = value
+            if key == "Model":
+                if value.startswith("Blackmagic Web Presenter"):
+                    self.model = MODEL_STREAMING
+            elif key == "Label":
+                self.name = value
+        elif block == "STREAM STATE":
+            if self.stream_state.get(key) == value:
+                return False
+            self.stream_state[key] = value
+            if key in STREAM_TELEMETRY_KEYS:
+                self.stream_telemetry[key] = parse_telemetry(key, value)
+                if self.initialised.is_set():
+                    self._send_telemetry_callback(key)
+                return False
+            if key == "Status" and self._statusWaiters:
+                self._resolve_waiters(self._statusWaiters, value)
+            return True
+        elif block == "STREAM SETTINGS":
+            if self.stream_set.get(key) == value:
+                return False
+            self.stream_set[key] = value
+            if key in OPTION_FIELDS:
+                self._update_options(key, value)
+            return True
+        elif block == "TERANEX MINI DEVICE" or block == "VIDEO OUTPUT":
+            if block == "TERANEX MINI DEVICE":
+                if key == "Unique ID":
+                    self.attrs[key] = value
+                elif key == "Label":
+                    self.name = value
+            if self.teranex_set.get(key) == value:
+                return False
+            self.teranex_set[key] = value
+            if key in OPTION_FIELDS:
+                self._update_options(key, value)
+            return True
+        return False
+
+    def _update_options(self, key, value):
+        """Recompute the cached option tuple fed by a capability field, if it changed."""
+        if self._optionSources.get(key) == value:
+            return
+        self._optionSources[key] = value
+
+        option = OPTION_FIELDS[key]
+        if option == "platform":
+            self.options[option] = _split_options(
+                self._optionSources.get("Available Default Platforms")
+            ) + _split_options(self._optionSources.get("Available Custom Platforms"))
+        elif option == "lut":
+            try:
+                count = int(value)
+            except ValueError:
+                count = 0
+            self.options[option] = ("none",) + tuple("Lut %d" % x for x in range(count))
+        else:
+            self.options[option] = _split_options(value)
 
     def connection_lost(self, exc):
         """asyncio callback for a lost TCP connection"""
         self._connected = False
+        self._rxBuffer.clear()
+        self._currentBlock = None
+        self._blockChanged = False
+        self._reset_awaiting_ack()
+        for waiters in itertools.chain(self._queryWaiters.values(), self._blockWaiters.values()):
+            self._complete_futures(waiters, False)
+        self._queryWaiters.clear()
+        self._blockWaiters.clear()
+        if self._drainHandle is not None:
+            self._drainHandle.cancel()
+            self._drainHandle = None
+        self._set_state(STATE_DISCONNECTED)
+        if self._commandQueue:
+            _LOGGER.warning("Discarding %i queued commands", len(self._commandQueue))
+            self.commands_dropped += len(self._commandQueue)
+            self._commandQueue.clear()
         self.initialised.set()
         self._send_update_callback()
+        self._send_telemetry_callback()
         _LOGGER.error("Connection to the server lost")
         if not self._stopped:
             self.connect()
@@ -147,6 +616,7 @@ class SmartVideoHub(asyncio.Protocol):
             )
         )
         self._connecting = True
+        self._set_state(STATE_CONNECTING)
         coro = self._eventLoop.create_connection(
             lambda: self, self._cmdServer, self._cmdServerPort
         )
@@ -162,17 +632,150 @@ class SmartVideoHub(asyncio.Protocol):
         """Public method for shutting down connectivity with the envisalink."""
         self._connected = False
         self._stopped = True
+        self._set_state(STATE_STOPPED)
+        if self._drainHandle is not None:
+            self._drainHandle.cancel()
+            self._drainHandle = None
         self._transport.close()
 
     def _send_update_callback(self, output_id=False):
         """Internal method to notify all update callback subscribers."""
-        if not self._updateCallbacks:
+        if not self._updateCallbacks and self._debug:
             _LOGGER.debug("Update callback has not been set by client")
 
+        started = time.perf_counter()
         for callback in self._updateCallbacks:
             callback(output_id=output_id)
+        elapsed = time.perf_counter() - started
+        self._callbackElapsed += elapsed
+        self.update_callback_timing.add(elapsed)
+
+    def _send_telemetry_callback(self, key=None):
+        """Internal method to notify telemetry subscribers of a STREAM STATE change.
+
+        A key of None means every telemetry value may have changed, e.g. on disconnect.
+        """
+        started = time.perf_counter()
+        for callback in self._telemetryCallbacks:
+            callback(key=key)
+        elapsed = time.perf_counter() - started
+        self._callbackElapsed += elapsed
+        self.telemetry_callback_timing.add(elapsed)
+
+    def _send_command(self, command, key=None, waiter=None):
+        """Queue a command for the device, returning False if it was dropped.
+
+        A command with the same key as one still queued replaces it in place.
+        A waiter future is completed with True once the device has ACKed the
+        command and sent the block it names, or False if it was NAKed.
+        Called from another thread, the command is handed to the event loop
+        and True is returned.
+        """
+        if not self._on_loop():
+            self._eventLoop.call_soon_threadsafe(self._send_command, command, key, waiter)
+            return True
+        if key is None:
+            key = next(self._commandIds)
+        if key in self._commandQueue:
+            self.commands_merged += 1
+        elif len(self._commandQueue) >= self._maxQueue:
+            self.commands_dropped += 1
+            _LOGGER.warning("Outbound command queue is full, dropping %s", command.split(":", 1)[0])
+            return False
+        self._commandQueue[key] = command
+        if waiter is not None:
+            self._queryWaiters.setdefault(key, []).append(waiter)
+        self._drain_queue()
+        return True
+
+    def _on_loop(self):
+        """True when called from the thread running this client's event loop."""
+        try:
+            return asyncio.get_running_loop() is self._eventLoop
+        except RuntimeError:
+            return False
+
+    def _drain_queue(self):
+        """Write queued commands while tokens are available and the transport accepts data."""
+        if self._drainHandle is not None:
+            # Already waiting for a token, the timer drains the queue
+            return
+        if self._writingPaused or not self._connected or self._transport is None:
+            return
+
+        now = self._eventLoop.time()
+        self._tokens = min(
+            self._commandBurst,
+            self._tokens + (now - self._tokensUpdated) * self._commandRate,
+        )
+        self._tokensUpdated = now
+        while self._commandQueue and self._tokens >= 1:
+            key, command = self._commandQueue.popitem(last=False)
+            self._tokens -= 1
+            if len(self._awaitingAck) >= self._maxQueue:
+                # The device is not answering, later ACKs can't be matched to these commands
+                _LOGGER.warning("%i commands were not acknowledged, resetting", len(self._awaitingAck))
+                self.ack_overflows += 1
+                self._reset_awaiting_ack()
+            self._awaitingAck.append(
+                (time.monotonic(), command.split(":", 1)[0], self._queryWaiters.pop(key, None))
+            )
+            self._transport.write(command.encode("ascii"))
+            if self._writingPaused:
+                return
+
+        if self._commandQueue:
+            self._drainHandle = self._eventLoop.call_later(
+                (1 - self._tokens) / self._commandRate, self._drain_timer
+            )
+
+    def _drain_timer(self):
+        self._drainHandle = None
+        self._drain_queue()
+
+    @property
+    def queue_depth(self):
+        """Number of commands waiting to be written to the device."""
+        return len(self._commandQueue)
+
+    def diagnostics(self):
+        """Snapshot of the client state, queue and timing for troubleshooting."""
+        return {
+            "model": self.model,
+            "name": self.name,
+            "connected": self._connected,
+            "initialised": self.is_initialised,
+            "attrs": dict(self.attrs),
+            "inputs": dict(self.inputs),
+            "outputs": {output: dict(entry) for output, entry in self.outputs.items()},
+            "stream_settings": dict(self.stream_set),
+            "stream_state": dict(self.stream_state),
+            "teranex_settings": dict(self.teranex_set),
+            "state_history": list(self.state_history),
+            "queue": {
+                "depth": self.queue_depth,
+                "merged": self.commands_merged,
+                "dropped": self.commands_dropped,
+                "awaiting_ack": len(self._awaitingAck),
+                "ack_overflows": self.ack_overflows,
+                "nak": self.commands_nak,
+            },
+            "command_latency": {
+                "buckets_ms": list(LATENCY_BUCKETS) + ["inf"],
+                "counts": {block: list(counts) for block, counts in self.command_latency.items()},
+            },
+            "timing": {
+                "parse": self.parse_timing.as_dict(),
+                "update_callbacks": self.update_callback_timing.as_dict(),
+                "telemetry_callbacks": self.telemetry_callback_timing.as_dict(),
+            },
+        }
 
     def set_input(self, outputNumber, inputNumber):
+        if not self._on_loop():
+            # Queue and history are only changed on the event loop thread
+            self._eventLoop.call_soon_threadsafe(self.set_input, outputNumber, inputNumber)
+            return
         if (
             outputNumber <= len(self.outputs)
             and inputNumber <= len(self.inputs)
@@ -186,7 +789,75 @@ class SmartVideoHub(asyncio.Protocol):
                 + str(inputNumber - 1)
                 + "\n\n"
             )
-            self._transport.write(command.encode("ascii"))
+            key = ("VIDEO OUTPUT ROUTING", outputNumber)
+            merged = key in self._commandQueue
+            if self._send_command(command, key):
+                self._record_local_route(outputNumber, inputNumber, merged)
+
+    def _record_local_route(self, outputNumber, inputNumber, merged):
+        """Record a queued route request, folding it into the request it replaced."""
+        entry = HistoryEntry(
+            time.time(), HISTORY_ROUTE, outputNumber,
+            self.outputs[outputNumber].get("input"), inputNumber, SOURCE_LOCAL
+        )
+        if merged:
+            for position in range(len(self.history) - 1, -1, -1):
+                previous = self.history[position]
+                if (
+                    previous.source == SOURCE_LOCAL
+                    and previous.kind == HISTORY_ROUTE
+                    and previous.index == outputNumber
+                ):
+                    self.history[position] = entry._replace(old=previous.old)
+                    return
+        self.history.append(entry)
+
+    @staticmethod
+    def _complete_futures(futures, result):
+        for future in futures:
+            if not future.done():
+                future.set_result(result)
+
+    @staticmethod
+    def _resolve_waiters(waiters, value):
+        """Complete the waiting futures registered for value."""
+        for wanted, future in waiters:
+            if wanted == value and not future.done():
+                future.set_result(True)
+
+    async def _wait(self, waiters, value, timeout):
+        """Wait for a future registered in waiters, returning False on timeout."""
+        waiter = (value, self._eventLoop.create_future())
+        waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(waiter[1], timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            waiters.remove(waiter)
+
+    async def wait_for_route(self, outputNumber, inputNumber, timeout=None):
+        """Wait until the device confirms outputNumber is displaying inputNumber.
+
+        Returns True as soon as the routing is confirmed, or False on timeout.
+        """
+        if outputNumber in self.outputs and self.outputs[outputNumber].get("input") == inputNumber:
+            return True
+        waiters = self._routeWaiters.setdefault(outputNumber, [])
+        try:
+            return await self._wait(waiters, inputNumber, timeout)
+        finally:
+            if not waiters:
+                del self._routeWaiters[outputNumber]
+
+    async def wait_for_stream_status(self, status, timeout=None):
+        """Wait until the device reports the stream status, e.g. Streaming or Idle.
+
+        Returns True as soon as the status is reported, or False on timeout.
+        """
+        if self.stream_state.get("Status") == status:
+            return True
+        return await self._wait(self._statusWaiters, status, timeout)
 
     def set_input_by_name(self, outputNumber, inputName):
         input_list = self.get_input_list()
@@ -221,16 +892,109 @@ class SmartVideoHub(asyncio.Protocol):
 
     def get_selected_input(self, output_number):
         if output_number in self.outputs:
-            return self.outputs[output_number]["input"]
+            return self.outputs[output_number].get("input")
         else:
             return None
 
+    def _snapshot(self):
+        """Copy of the state compared by resync()."""
+        return (
+            dict(self.inputs),
+            {output: (entry.get("name"), entry.get("input")) for output, entry in self.outputs.items()},
+            dict(self.stream_set),
+            # Telemetry ticks constantly while streaming and is not drift
+            {key: value for key, value in self.stream_state.items() if key not in STREAM_TELEMETRY_KEYS},
+            dict(self.teranex_set),
+        )
+
+    async def resync(self, timeout=RESYNC_TIMEOUT):
+        """Re-request this model's state blocks and return how many inputs, outputs and settings changed.
+
+        Each query's response is the first block of that name after its ACK,
+        so echoes of other clients' changes can't end the resync early. Changes
+        are applied and notified by the normal parse path, so only the outputs
+        and settings which differ are refreshed. Returns None if a query could
+        not be queued, was NAKed or was not answered within timeout.
+        """
+        blocks = RESYNC_BLOCKS.get(self.model, ())
+        if not blocks or not self._connected:
+            return None
+
+        before = self._snapshot()
+        futures = []
+        for block in blocks:
+            future = self._eventLoop.create_future()
+            futures.append(future)
+            if not self._send_command("%s:\n\n" % block, ("QUERY", block), future):
+                _LOGGER.warning("Resync of %s could not be queued", self.name)
+                self._complete_futures(futures, False)
+                return None
+        try:
+            answered = await asyncio.wait_for(asyncio.gather(*futures), timeout)
+        except asyncio.TimeoutError:
+            _LOGGER.warning("Resync of %s timed out", self.name)
+            return None
+        if not all(answered):
+            _LOGGER.warning("Resync of %s was rejected by the device", self.name)
+            return None
+
+        changes = 0
+        for old, new in zip(before, self._snapshot()):
+            changes += sum(1 for key in new if old.get(key) != new[key])
+        _LOGGER.debug("Resync of %s found %i changed values", self.name, changes)
+        return changes
+
+    async def drift_check(self, interval):
+        """Periodically resync and report state which drifted from the device."""
+        while not self._stopped:
+            await asyncio.sleep(interval)
+            if self._connected and self.is_initialised:
+                changes = await self.resync()
+                if changes:
+                    _LOGGER.warning(
+                        "Corrected %i entries on %s which had drifted from the device",
+                        changes,
+                        self.name,
+                    )
+
+    def get_history(self, output=None, start=None, end=None):
+        """Return history entries, oldest first.
+
+        output restricts the result to routing and label changes of that output,
+        start and end are epoch timestamps bounding the time window.
+        """
+        entries = []
+        for entry in reversed(self.history):
+            if start is not None and entry.timestamp < start:
+                break
+            if end is not None and entry.timestamp > end:
+                continue
+            if output is not None and (
+                entry.index != output or entry.kind == HISTORY_INPUT_LABEL
+            ):
+                continue
+            entries.append(entry)
+        entries.reverse()
+        return entries
+
+    def get_input_at(self, output, timestamp):
+        """Return the input the device reported on output at timestamp, if still in history."""
+        for entry in reversed(self.history):
+            if (
+                entry.timestamp <= timestamp
+                and entry.index == output
+                and entry.kind == HISTORY_ROUTE
+                and entry.source == SOURCE_DEVICE
+            ):
+                return entry.new
+        return None
+
     async def keep_alive(self):
         """Send a keepalive command to reset its watchdog timer."""
         while self._connected:
             _LOGGER.debug("Sending keepalive to the server")
             command = "PING:\n\n"
-            self._transport.write(command.encode("ascii"))
+            self._send_command(command, "PING")
             await asyncio.sleep(120)
 
     def get_outputs(self):
@@ -253,21 +1017,25 @@ class SmartVideoHub(asyncio.Protocol):
         """Public method to add a callback subscriber."""
         self._updateCallbacks.append(method)
 
+    def add_telemetry_callback(self, method):
+        """Public method to subscribe to streaming telemetry changes."""
+        self._telemetryCallbacks.append(method)
+
     def set_video_mode(self, mode):
         command = "STREAM SETTINGS:\nVideo Mode: %s\n\n" % mode
-        self._transport.write(command.encode("ascii"))
+        self._send_command(command, ("STREAM SETTINGS", "Video Mode"))
 
     def set_stream_platform(self, platform):
         command = "STREAM SETTINGS:\nCurrent Platform: %s\n\n" % platform
-        self._transport.write(command.encode("ascii"))
+        self._send_command(command, ("STREAM SETTINGS", "Current Platform"))
 
     def set_stream_key(self, mode):
         command = "STREAM SETTINGS:\nStream Key: %s\n\n" % mode
-        self._transport.write(command.encode("ascii"))
+        self._send_command(command, ("STREAM SETTINGS", "Stream Key"))
 
     def set_quality_level(self, mode):
         command = "STREAM SETTINGS:\nCurrent Quality Level: %s\n\n" % mode
-        self._transport.write(command.encode("ascii"))
+        self._send_command(command, ("STREAM SETTINGS", "Current Quality Level"))
 
     def set_lut(self, lut_id):
         if isinstance(lut_id, int) and int(lut_id) == 1:
@@ -279,12 +1047,12 @@ class SmartVideoHub(asyncio.Protocol):
         elif isinstance(lut_id, str):
             lut = lut_id
         command = "VIDEO OUTPUT:\nLut on loop: true\nLut selection: %s\n\n" % lut
-        self._transport.write(command.encode("ascii"))
+        self._send_command(command, ("VIDEO OUTPUT", "Lut selection"))
 
     def set_steam_state(self, mode):
         command = "STREAM STATE:\nAction: %s\n\n" % ("Start" if mode else "Stop")
-        self._transport.write(command.encode("ascii"))
+        self._send_command(command, ("STREAM STATE", "Action"))
 
     def reboot(self):
         command = "SHUTDOWN:\nAction: Reboot\n\n"
-        self._transport.write(command.encode("ascii"))
\ No newline at end of file
+        self._send_command(command, "SHUTDOWN")
\ No newline at end of file
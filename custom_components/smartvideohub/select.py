@@ -77,22 +77,17 @@ class StreamingSelectDevice(SelectEntity):
 
     def update(self):
         """Retrieve latest state."""
+        self._attr_options = self._dev.options.get(self._attr_translation_key, ())
         if self._attr_translation_key == "platform":
             self._attr_current_option = self._dev.stream_set.get("Current Platform")
-            self._attr_options = self._dev.stream_set.get("Available Default Platforms").split(", ") + \
-                                 self._dev.stream_set.get("Available Custom Platforms").split(", ")
             self._attr_available = self._dev.stream_state.get("Status") == "Idle" and self._dev.connected
         elif self._attr_translation_key == "video_mode":
             self._attr_current_option = self._dev.stream_set.get("Video Mode")
-            self._attr_options = self._dev.stream_set.get("Available Video Modes").split(", ")
             self._attr_available = self._dev.stream_state.get("Status") == "Idle" and self._dev.connected
         elif self._attr_translation_key == "quality_level":
             self._attr_current_option = self._dev.stream_set.get("Current Quality Level")
-            self._attr_options = self._dev.stream_set.get("Available Quality Levels").split(", ")
             self._attr_available = self._dev.stream_state.get("Status") == "Idle" and self._dev.connected
         elif self._attr_translation_key == "lut":
-            self._attr_options = ["none"]
-            self._attr_options.extend(["Lut %d" % x for x in range(int(self._dev.teranex_set.get("Number of LUTs")))])
             self._attr_current_option = self._dev.teranex_set.get("Lut selection", "none")
             self._attr_available = self._dev.connected
 
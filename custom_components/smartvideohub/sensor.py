@@ -0,0 +1,128 @@
+import logging
+import time
+
+from homeassistant.components.sensor import (
+    ENTITY_ID_FORMAT,
+    SensorEntity,
+    SensorDeviceClass,
+    SensorStateClass,
+)
+from homeassistant.const import PERCENTAGE, UnitOfDataRate, UnitOfTime
+from homeassistant.helpers.entity import async_generate_entity_id, DeviceInfo
+from .const import *
+
+_LOGGER = logging.getLogger(__name__)
+
+# translation_key: (STREAM STATE key, device class, unit, apply change threshold)
+TELEMETRY_SENSORS = {
+    "bitrate": ("Bitrate", SensorDeviceClass.DATA_RATE, UnitOfDataRate.BITS_PER_SECOND, True),
+    "duration": ("Duration", SensorDeviceClass.DURATION, UnitOfTime.SECONDS, False),
+    "cache_used": ("Cache Used", None, PERCENTAGE, True),
+}
+
+async def async_setup_entry(hass, config_entry, async_add_entities):
+    """Set up SmartVideoHub Device"""
+    dev = hass.data[DOMAIN][config_entry.entry_id]['client']
+
+    deviceInfo = DeviceInfo(
+        identifiers={(DOMAIN, config_entry.entry_id)},
+        name= dev.name,
+        manufacturer="BlackMagic Design",
+        model=dev.model
+    )
+    min_interval = config_entry.options.get(CONF_TELEMETRY_INTERVAL, DEFAULT_TELEMETRY_INTERVAL)
+    threshold = config_entry.options.get(CONF_TELEMETRY_THRESHOLD, DEFAULT_TELEMETRY_THRESHOLD)
+    if dev.model == MODEL_STREAMING:
+        async_add_entities(
+            [
+                StreamingSensorDevice(
+                    hass,
+                    dev,
+                    translation_key,
+                    deviceInfo,
+                    min_interval,
+                    threshold
+                )
+                for translation_key in TELEMETRY_SENSORS
+            ],
+            True,
+        )
+
+class StreamingSensorDevice(SensorEntity):
+    """Streaming telemetry value, written to HA at most once per min_interval.
+
+    Values which moved by less than threshold percent of the last written value
+    are not written at all, other skipped values are flushed once the interval
+    has elapsed.
+    """
+    _attr_has_entity_name = True
+    _attr_should_poll = False
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    def __init__(
+        self,
+        hass,
+        dev,
+        translation_key,
+        deviceInfo,
+        min_interval,
+        threshold
+    ):
+        """Initialize new sensor."""
+        self._dev = dev
+        self._key, device_class, unit, use_threshold = TELEMETRY_SENSORS[translation_key]
+        self._attr_translation_key = translation_key
+        self._attr_device_class = device_class
+        self._attr_native_unit_of_measurement = unit
+        self._attr_unique_id = async_generate_entity_id(
+            ENTITY_ID_FORMAT,
+            dev.attrs.get("Unique ID", "")+"/"+translation_key,
+            hass=hass,
+        )
+        self._attr_device_info = deviceInfo
+        self._min_interval = min_interval
+        self._threshold = threshold if use_threshold else 0
+        self._last_write = 0.0
+        self._flush_handle = None
+        dev.add_telemetry_callback(self.telemetry_callback)
+
+    def _read_value(self):
+        value = self._dev.stream_telemetry.get(self._key)
+        if self._key == "Duration" and value is not None:
+            return int(value.total_seconds())
+        return value
+
+    def update(self):
+        """Retrieve latest state."""
+        self._attr_native_value = self._read_value()
+        self._attr_available = self._dev.connected
+
+    def telemetry_callback(self, key=None):
+        """Called when pySmartVideoHub receives a telemetry change"""
+        if key is not None and key != self._key:
+            return
+
+        value = self._read_value()
+        previous = self._attr_native_value
+        if key is not None and value is not None and previous is not None:
+            if self._threshold and abs(value - previous) < abs(previous) * self._threshold / 100:
+                return
+            remaining = self._min_interval - (time.monotonic() - self._last_write)
+            if remaining > 0:
+                if self._flush_handle is None:
+                    self._flush_handle = self.hass.loop.call_later(remaining, self._flush)
+                return
+        self._flush()
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self._last_write = time.monotonic()
+        self.update()
+        self.schedule_update_ha_state(False)
+
+    async def async_will_remove_from_hass(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
@@ -0,0 +1,142 @@
+"""Services for the Smart Video Hub integration."""
+from __future__ import annotations
+
+import voluptuous as vol
+
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse
+from homeassistant.exceptions import HomeAssistantError, ServiceValidationError
+import homeassistant.helpers.config_validation as cv
+from homeassistant.util import dt as dt_util
+
+from .const import *
+
+SERVICE_WAIT_FOR_ROUTE = "wait_for_route"
+SERVICE_WAIT_FOR_STREAM_STATUS = "wait_for_stream_status"
+SERVICE_QUERY_HISTORY = "query_history"
+SERVICE_RESYNC = "resync"
+
+WAIT_FOR_ROUTE_SCHEMA = vol.Schema({
+    vol.Required(ATTR_CONFIG_ENTRY_ID): cv.string,
+    vol.Required(ATTR_OUTPUT): cv.positive_int,
+    vol.Required(ATTR_INPUT): cv.positive_int,
+    vol.Optional(ATTR_TIMEOUT, default=DEFAULT_WAIT_TIMEOUT): vol.All(
+        vol.Coerce(float), vol.Range(min=0, max=MAX_WAIT_TIMEOUT)
+    ),
+})
+
+WAIT_FOR_STREAM_STATUS_SCHEMA = vol.Schema({
+    vol.Required(ATTR_CONFIG_ENTRY_ID): cv.string,
+    vol.Required(ATTR_STATUS): cv.string,
+    vol.Optional(ATTR_TIMEOUT, default=DEFAULT_WAIT_TIMEOUT): vol.All(
+        vol.Coerce(float), vol.Range(min=0, max=MAX_WAIT_TIMEOUT)
+    ),
+})
+
+QUERY_HISTORY_SCHEMA = vol.Schema({
+    vol.Required(ATTR_CONFIG_ENTRY_ID): cv.string,
+    vol.Optional(ATTR_OUTPUT): cv.positive_int,
+    vol.Optional(ATTR_START): cv.datetime,
+    vol.Optional(ATTR_END): cv.datetime,
+})
+
+RESYNC_SCHEMA = vol.Schema({
+    vol.Required(ATTR_CONFIG_ENTRY_ID): cv.string,
+})
+
+
+def history_entry_as_dict(entry) -> dict:
+    """Convert a client HistoryEntry into a JSON friendly dict."""
+    return {
+        "time": dt_util.utc_from_timestamp(entry.timestamp).isoformat(),
+        "kind": entry.kind,
+        "index": entry.index,
+        "old": entry.old,
+        "new": entry.new,
+        "source": entry.source,
+    }
+
+
+def _get_client(hass: HomeAssistant, call: ServiceCall):
+    entry_id = call.data[ATTR_CONFIG_ENTRY_ID]
+    if entry_id not in hass.data.get(DOMAIN, {}):
+        raise ServiceValidationError("Smart Video Hub %s is not loaded" % entry_id)
+    return hass.data[DOMAIN][entry_id]["client"]
+
+
+async def async_setup_services(hass: HomeAssistant) -> None:
+    """Register the integration services."""
+
+    async def wait_for_route(call: ServiceCall) -> ServiceResponse:
+        client = _get_client(hass, call)
+        matched = await client.wait_for_route(
+            call.data[ATTR_OUTPUT], call.data[ATTR_INPUT], call.data[ATTR_TIMEOUT]
+        )
+        return {
+            "matched": matched,
+            "input": client.get_selected_input(call.data[ATTR_OUTPUT]),
+        }
+
+    async def wait_for_stream_status(call: ServiceCall) -> ServiceResponse:
+        client = _get_client(hass, call)
+        matched = await client.wait_for_stream_status(
+            call.data[ATTR_STATUS], call.data[ATTR_TIMEOUT]
+        )
+        return {
+            "matched": matched,
+            "status": client.stream_state.get("Status"),
+        }
+
+    async def query_history(call: ServiceCall) -> ServiceResponse:
+        client = _get_client(hass, call)
+        output = call.data.get(ATTR_OUTPUT)
+        start = call.data.get(ATTR_START)
+        end = call.data.get(ATTR_END)
+        start = dt_util.as_timestamp(start) if start is not None else None
+        end = dt_util.as_timestamp(end) if end is not None else None
+        response = {
+            "entries": [
+                history_entry_as_dict(entry)
+                for entry in client.get_history(output, start, end)
+            ],
+        }
+        if output is not None:
+            response["input"] = client.get_input_at(
+                output, end if end is not None else dt_util.utcnow().timestamp()
+            )
+        return response
+
+    async def resync(call: ServiceCall) -> ServiceResponse:
+        client = _get_client(hass, call)
+        changes = await client.resync()
+        if changes is None:
+            raise HomeAssistantError("%s did not answer the resync" % client.name)
+        return {"changes": changes}
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_WAIT_FOR_ROUTE,
+        wait_for_route,
+        schema=WAIT_FOR_ROUTE_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_WAIT_FOR_STREAM_STATUS,
+        wait_for_stream_status,
+        schema=WAIT_FOR_STREAM_STATUS_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_QUERY_HISTORY,
+        query_history,
+        schema=QUERY_HISTORY_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_RESYNC,
+        resync,
+        schema=RESYNC_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )